@@ -1,15 +1,52 @@
 import os
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from flask_caching import Cache
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from datetime import datetime, timezone
 import click
 from flask.cli import with_appcontext
 import subprocess
+import threading
 from flask import current_app
+from sqlalchemy.exc import DBAPIError
 
 db = SQLAlchemy()
 migrate = Migrate()
+cache = Cache()
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
+def utcnow():
+    # Naive UTC, matching the existing timezone-less timestamp columns; datetime.utcnow() is deprecated
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def hash_password(password):
+    return password_hasher.hash(password)
+
+def verify_password(password_hash, password):
+    if not password_hash:
+        return False
+    if password_hash.startswith('$argon2'):
+        try:
+            return password_hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    # Hashes stored before the switch to Argon2 are Werkzeug PBKDF2 strings
+    return check_password_hash(password_hash, password)
+
+def password_needs_rehash(password_hash):
+    if not password_hash.startswith('$argon2'):
+        return True
+    return password_hasher.check_needs_rehash(password_hash)
+
+def is_unique_violation(error, constraint=None):
+    # Postgres reports SQLSTATE 23505 and the violated index; SQLite only exposes the message text
+    if getattr(error.orig, 'pgcode', None) == '23505':
+        name = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)
+        return constraint is None or name is None or name == constraint
+    return str(error.orig).startswith('UNIQUE constraint failed')
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -21,14 +58,16 @@ class User(db.Model):
     branch = db.Column(db.String(64))
     department = db.Column(db.String(64))
     password_hash = db.Column(db.String(256))
-    reset_token = db.Column(db.String(128))
+    reset_token = db.Column(db.String(128), index=True)
     reset_token_expiry = db.Column(db.DateTime)
 
+    correction_requests = db.relationship('CorrectionRequest', back_populates='user', lazy='dynamic', passive_deletes=True)
+
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -41,6 +80,18 @@ class Attendance(db.Model):
     duration = db.Column(db.Integer)
     status = db.Column(db.String(20), default='absent')
 
+    correction_requests = db.relationship('CorrectionRequest', back_populates='attendance', lazy='dynamic', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_att_user_status', 'user_id', 'status'),
+        db.Index('ix_att_period_user_status', 'period', 'user_id', 'status'),
+        db.Index('ix_attendance_user_time', user_id, check_in_time.desc()),
+        # At most one open (not checked out) attendance row per user
+        db.Index('ix_attendance_open', 'user_id', unique=True,
+                 postgresql_where=db.text('check_out_time IS NULL'),
+                 sqlite_where=db.text('check_out_time IS NULL')),
+    )
+
 class TimeTable(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(64), db.ForeignKey('user.user_id'), nullable=False)
@@ -51,6 +102,10 @@ class TimeTable(db.Model):
     block_name = db.Column(db.String(64))
     wifi_name = db.Column(db.String(64))
 
+    __table_args__ = (
+        db.Index('ix_timetable_user_day_start', 'user_id', 'day', 'start_time'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -68,62 +123,166 @@ class Notification(db.Model):
     faculty_id = db.Column(db.String(64), db.ForeignKey('user.user_id'), nullable=False)
     student_id = db.Column(db.String(64), db.ForeignKey('user.user_id'), nullable=False)
     message = db.Column(db.String(256), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
     is_read = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        db.Index('ix_notif_faculty_unread', 'faculty_id', postgresql_where=db.text('is_read = false')),
+    )
+
 class CorrectionRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.String(64), db.ForeignKey('user.user_id'), nullable=False)
-    attendance_id = db.Column(db.Integer, db.ForeignKey('attendance.id'), nullable=False)
+    user_id = db.Column(db.String(64), db.ForeignKey('user.user_id', ondelete='CASCADE'), nullable=False)
+    attendance_id = db.Column(db.Integer, db.ForeignKey('attendance.id', ondelete='CASCADE'), nullable=False)
     reason = db.Column(db.String(256), nullable=False)
     status = db.Column(db.String(20), default='pending')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_corr_status', 'status', postgresql_where=db.text("status = 'pending'")),
+    )
 
-    user = db.relationship('User', backref=db.backref('correction_requests', lazy=True))
-    attendance = db.relationship('Attendance', backref=db.backref('correction_requests', lazy=True))
+    user = db.relationship('User', back_populates='correction_requests', lazy='raise_on_sql')
+    attendance = db.relationship('Attendance', back_populates='correction_requests', lazy='raise_on_sql')
 
 class UserActivity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(64), db.ForeignKey('user.user_id'), nullable=False)
     activity_type = db.Column(db.String(50), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=utcnow)
     details = db.Column(db.String(255))
 
     def __repr__(self):
         return f'<UserActivity {self.id}: {self.user_id} - {self.activity_type}>'
 
+# Per-user daily attendance totals, read by the student chart endpoints. It is a
+# Postgres materialized view, so it is not part of db.metadata / create_all().
+attendance_daily_summary = db.table(
+    'attendance_daily_summary',
+    db.column('user_id', db.String(64)),
+    db.column('day', db.Date),
+    db.column('total', db.Integer),
+    db.column('attended', db.Integer)
+)
+
+def create_attendance_daily_summary():
+    if db.engine.dialect.name != 'postgresql':
+        return
+    db.session.execute(db.text("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS attendance_daily_summary AS
+        SELECT user_id,
+               date(check_in_time) AS day,
+               count(*) AS total,
+               sum(CASE WHEN status = 'present' THEN 1 ELSE 0 END) AS attended
+        FROM attendance
+        GROUP BY user_id, date(check_in_time)
+    """))
+    # REFRESH ... CONCURRENTLY requires a unique index on the view
+    db.session.execute(db.text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_attendance_daily_summary_user_day '
+        'ON attendance_daily_summary (user_id, day)'
+    ))
+    db.session.commit()
+
+# Trigram indexes back the ILIKE '%...%' filters in the student search endpoint. They
+# need the pg_trgm contrib extension, so they are created outside create_all() and
+# skipped when the extension is missing or can't be installed.
+TRIGRAM_INDEXES = {
+    'ix_attendance_period_trgm': 'period',
+    'ix_attendance_block_name_trgm': 'block_name',
+    'ix_attendance_status_trgm': 'status',
+}
+
+def create_trigram_indexes():
+    if db.engine.dialect.name != 'postgresql':
+        return
+    available = db.session.execute(db.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    )).scalar()
+    if not available:
+        current_app.logger.warning('pg_trgm is not available; skipping trigram indexes')
+        return
+    try:
+        db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.session.commit()
+    except DBAPIError as e:
+        db.session.rollback()
+        current_app.logger.warning(f'Could not create pg_trgm extension; skipping trigram indexes: {str(e)}')
+        return
+    for name, column in TRIGRAM_INDEXES.items():
+        db.session.execute(db.text(
+            f'CREATE INDEX IF NOT EXISTS {name} ON attendance USING gin ({column} gin_trgm_ops)'
+        ))
+    db.session.commit()
+
+def attendance_daily_source():
+    # The view only exists on Postgres; other dialects aggregate attendance on the fly
+    if db.engine.dialect.name == 'postgresql':
+        return attendance_daily_summary
+    day = db.func.date(Attendance.check_in_time, type_=db.Date)
+    return db.select(
+        Attendance.user_id,
+        day.label('day'),
+        db.func.count().label('total'),
+        db.func.sum(db.case((Attendance.status == 'present', 1), else_=0)).label('attended')
+    ).group_by(Attendance.user_id, day).subquery('attendance_daily_summary')
+
+def refresh_attendance_daily_summary():
+    db.session.execute(db.text('REFRESH MATERIALIZED VIEW CONCURRENTLY attendance_daily_summary'))
+    db.session.commit()
+
+def run_logged(app, args):
+    # pg_dump/pg_restore -v are chatty on stderr; drain it into the app log from a
+    # separate thread so the pipe never fills up and stalls the child process.
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+
+    def drain():
+        for line in process.stdout:
+            app.logger.info(line.rstrip())
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    returncode = process.wait()
+    reader.join()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args)
+
 def backup_database(app):
     # Replace hardcoded credentials with environment variables
     db_url = app.config['SQLALCHEMY_DATABASE_URI']
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = f"backup_{timestamp}.sql"
+    backup_dir = f"backup_{timestamp}"
     try:
-        subprocess.run([
+        # Directory format is the only pg_dump format that supports parallel jobs
+        run_logged(app, [
             "pg_dump",
             db_url,
-            "-F", "c",
+            "-F", "d",
+            "-j", str(os.cpu_count() or 4),
             "-b",
             "-v",
-            "-f", backup_file,
-        ], check=True)
-        return backup_file
+            "-f", backup_dir,
+        ])
+        return backup_dir
     except Exception as e:
         app.logger.error(f"Database backup failed: {str(e)}")
         return None
 
-def restore_database(app, backup_file):
+def restore_database(app, backup_dir):
     db_url = app.config['SQLALCHEMY_DATABASE_URI']
-    if not os.path.exists(backup_file):
-        app.logger.error(f"Backup file not found: {backup_file}")
+    if not os.path.exists(backup_dir):
+        app.logger.error(f"Backup not found: {backup_dir}")
         return False
     try:
-        subprocess.run([
+        run_logged(app, [
             "pg_restore",
-            db_url,
+            "-d", db_url,
+            "-j", str(os.cpu_count() or 4),
+            "--no-owner",
             "-v",
-            backup_file
-        ], check=True)
+            backup_dir
+        ])
         return True
     except Exception as e:
         app.logger.error(f"Database restore failed: {str(e)}")
@@ -133,8 +292,19 @@ def restore_database(app, backup_file):
 @with_appcontext
 def init_db_command():
     db.create_all()
+    create_trigram_indexes()
+    create_attendance_daily_summary()
     click.echo('Initialized the database.')
 
+# Nothing refreshes the view automatically: until this runs, the student charts on
+# Postgres don't include new check-ins. Schedule it (e.g. nightly cron or a systemd
+# timer running `flask refresh-attendance-summary`) for the freshness the charts need.
+@click.command('refresh-attendance-summary')
+@with_appcontext
+def refresh_attendance_summary_command():
+    refresh_attendance_daily_summary()
+    click.echo('Refreshed the attendance daily summary.')
+
 @click.command('backup-db')
 @with_appcontext
 def backup_db_command():
@@ -164,14 +334,23 @@ def init_db(app):
             
     db.init_app(app)
     migrate.init_app(app, db)
+
+    redis_url = os.environ.get('REDIS_URL')
+    app.config.setdefault('CACHE_TYPE', 'RedisCache' if redis_url else 'SimpleCache')
+    app.config.setdefault('CACHE_REDIS_URL', redis_url)
+    cache.init_app(app)
     
     # Register CLI commands
     app.cli.add_command(init_db_command)
     app.cli.add_command(backup_db_command)
     app.cli.add_command(restore_db_command)
+    # Must be scheduled externally; see refresh_attendance_summary_command
+    app.cli.add_command(refresh_attendance_summary_command)
 
     with app.app_context():
         db.create_all()
+        create_trigram_indexes()
+        create_attendance_daily_summary()
 
 def get_db_connection():
     return db
\ No newline at end of file
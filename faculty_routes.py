@@ -1,16 +1,20 @@
-from flask import request, jsonify, send_file
+from flask import request, jsonify, send_file, Response, stream_with_context
 from flask_restx import Namespace, Resource, fields
-from database import db, User, TimeTable, Attendance, Notification, CorrectionRequest
+from database import db, cache, User, TimeTable, Attendance, Notification, CorrectionRequest
 from auth import token_required
 import csv
 from io import StringIO, BytesIO
-from sqlalchemy import func, case
+from sqlalchemy import func, case, select, update, lambda_stmt
+from sqlalchemy.orm import selectinload, raiseload
 from datetime import datetime, timedelta
 import pandas as pd
+import numpy as np
+import orjson
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-import io
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle
+import os
+import tempfile
 
 faculty_ns = Namespace('faculty', description='Faculty operations')
 
@@ -25,6 +29,10 @@ timetable_model = faculty_ns.model('Timetable', {
     'wifi_name': fields.String(required=True, description='Wi-Fi name')
 })
 
+timetable_bulk_model = faculty_ns.model('TimetableBulk', {
+    'entries': fields.List(fields.Nested(timetable_model), required=True, description='Timetable entries to enter')
+})
+
 update_attendance_model = faculty_ns.model('UpdateAttendance', {
     'attendance_id': fields.String(required=True, description='Attendance ID to update'),
     'new_status': fields.String(required=True, description='New status for attendance (present, absent, late)')
@@ -34,6 +42,50 @@ notification_model = faculty_ns.model('Notification', {
     'notification_id': fields.String(required=True, description='Notification ID to mark as read')
 })
 
+# Per-student attendance totals shared by the threshold and export endpoints.
+# Built as a lambda statement so SQLAlchemy caches its compiled form across requests.
+attendance_summary_stmt = lambda_stmt(lambda: select(
+    User.user_id,
+    User.name,
+    func.count(Attendance.id).label('total_classes'),
+    func.sum(case((Attendance.status == 'present', 1), else_=0)).label('attended_classes')
+).join(Attendance, User.user_id == Attendance.user_id
+).where(User.role == 'student'
+).group_by(User.user_id, User.name))
+
+def json_response(payload, status=200):
+    # Flask-RESTX serializes dict returns with the stdlib json module; the
+    # large analytics payloads are encoded with orjson and returned directly.
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
+def is_faculty(user_id):
+    return db.session.query(
+        User.query.filter_by(user_id=user_id, role='faculty').exists()
+    ).scalar()
+
+def insert_timetables(current_user, entries):
+    """Validates and inserts timetable entries in one batch, returning an error response or None."""
+    rows = [{
+        'user_id': entry.get('timetable_user_id'),
+        'day': (entry.get('day') or '').lower(),
+        'period': entry.get('period'),
+        'start_time': entry.get('start_time'),
+        'end_time': entry.get('end_time'),
+        'block_name': entry.get('block_name'),
+        'wifi_name': entry.get('wifi_name')
+    } for entry in entries]
+
+    required = ('user_id', 'day', 'period', 'start_time', 'end_time', 'wifi_name')
+    if not rows or not all(row[field] for row in rows for field in required):
+        return {'status': 'error', 'message': 'All fields are required.'}, 400
+
+    if not is_faculty(current_user):
+        return {'status': 'error', 'message': 'Only faculty can enter timetable.'}, 403
+
+    db.session.bulk_insert_mappings(TimeTable, rows)
+    db.session.commit()
+    return None
+
 @faculty_ns.route('/enter_timetable')
 class EnterTimetable(Resource):
     @faculty_ns.expect(timetable_model)  # Expecting the timetable model
@@ -41,35 +93,31 @@ class EnterTimetable(Resource):
     def post(self, current_user):
         """Enters a new timetable for a student."""
         try:
-            data = request.get_json()
-            timetable_user_id = data.get('timetable_user_id')
-            day = data.get('day', '').lower()
-            period = data.get('period')
-            start_time = data.get('start_time')
-            end_time = data.get('end_time')
-            block_name = data.get('block_name')
-            wifi_name = data.get('wifi_name')
+            data = request.get_json(cache=True)
+            error = insert_timetables(current_user, [data])
+            if error:
+                return error
 
-            if not all([timetable_user_id, day, period, start_time, end_time, wifi_name]):
-                return {'status': 'error', 'message': 'All fields are required.'}, 400
+            return {'status': 'success', 'message': 'Timetable entered successfully.'}, 201
 
-            faculty = User.query.filter_by(user_id=current_user, role='faculty').first()
-            if not faculty:
-                return {'status': 'error', 'message': 'Only faculty can enter timetable.'}, 403
-
-            new_timetable = TimeTable(
-                user_id=timetable_user_id,
-                day=day,
-                period=period,
-                start_time=start_time,
-                end_time=end_time,
-                block_name=block_name,
-                wifi_name=wifi_name
-            )
-            db.session.add(new_timetable)
-            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return {'status': 'error', 'message': str(e)}, 500
 
-            return {'status': 'success', 'message': 'Timetable entered successfully.'}, 201
+@faculty_ns.route('/enter_timetable/bulk')
+class EnterTimetableBulk(Resource):
+    @faculty_ns.expect(timetable_bulk_model)  # Expecting the bulk timetable model
+    @token_required
+    def post(self, current_user):
+        """Enters several timetable entries in a single transaction."""
+        try:
+            data = request.get_json(cache=True)
+            entries = data.get('entries') or []
+            error = insert_timetables(current_user, entries)
+            if error:
+                return error
+
+            return {'status': 'success', 'message': f'{len(entries)} timetable entries entered successfully.'}, 201
 
         except Exception as e:
             db.session.rollback()
@@ -80,71 +128,91 @@ class AttendanceStatistics(Resource):
     @token_required
     def get(self, current_user):
         try:
+            # Collapse attendance to one row per (student, period) first so the outer
+            # query counts plain rows instead of COUNT(DISTINCT) over the whole join
+            per_student = db.session.query(
+                Attendance.user_id,
+                Attendance.period,
+                func.max(case((Attendance.status == 'present', 1), else_=0)).label('present')
+            ).group_by(Attendance.user_id, Attendance.period).subquery()
+
+            # A period scheduled on several weekdays has one timetable row per day;
+            # de-duplicate so each (student, period) pair is joined exactly once
+            slots = select(TimeTable.user_id, TimeTable.period).where(
+                TimeTable.user_id == current_user
+            ).distinct().subquery()
+
             stats = db.session.query(
-                TimeTable.period,
-                db.func.count(db.distinct(Attendance.user_id)).label('total_students'),
-    func.sum(case((Attendance.status == 'present', 1), else_=0)).label('present_count')
-            ).outerjoin(Attendance, (TimeTable.user_id == Attendance.user_id) & (TimeTable.period == Attendance.period)
-            ).filter(TimeTable.user_id == current_user
-            ).group_by(TimeTable.period).all()
-            
+                slots.c.period,
+                func.count(per_student.c.user_id).label('total_students'),
+                func.coalesce(func.sum(per_student.c.present), 0).label('present_count')
+            ).select_from(slots
+            ).outerjoin(per_student, (slots.c.user_id == per_student.c.user_id) & (slots.c.period == per_student.c.period)
+            ).group_by(slots.c.period).all()
+
             return {"status": "success", "data": [{'period': s.period, 'total_students': s.total_students, 'present_count': s.present_count} for s in stats]}, 200
         except Exception as e:
             return {"status": "error", "message": str(e)}, 500
 
+@cache.memoize(timeout=60)
+def student_analytics(department):
+    """Aggregates attendance for every student in a department in one query."""
+    students = db.session.query(
+        User.user_id,
+        User.name,
+        func.count(Attendance.id).label('total_classes'),
+        func.sum(case((Attendance.status == 'present', 1), else_=0)).label('attended_classes')
+    ).outerjoin(Attendance, Attendance.user_id == User.user_id
+    ).filter(User.role == 'student', User.department == department
+    ).group_by(User.user_id, User.name).all()
+
+    totals = np.fromiter((s.total_classes for s in students), dtype=np.int64, count=len(students))
+    attended = np.fromiter((s.attended_classes or 0 for s in students), dtype=np.int64, count=len(students))
+    percentages = np.where(totals > 0, np.round(attended * 100.0 / np.maximum(totals, 1), 2), 0.0)
+    zones = np.bincount(np.where(percentages >= 75, 0, np.where(percentages >= 60, 1, 2)), minlength=3)
+
+    analytics_data = [{
+        'user_id': student.user_id,
+        'name': student.name,
+        'total_classes': total_classes,
+        'attended_classes': attended_classes,
+        'attendance_percentage': attendance_percentage
+    } for student, total_classes, attended_classes, attendance_percentage in zip(
+        students, totals.tolist(), attended.tolist(), percentages.tolist()
+    )]
+    zone_distribution = dict(zip(('green', 'yellow', 'red'), zones.tolist()))
+
+    return {
+        'students': analytics_data,
+        'attendance_trend': [
+            # Add sample attendance trend data
+            {'date': '2024-03-01', 'attendance_rate': 85},
+            {'date': '2024-03-02', 'attendance_rate': 90},
+            # Add more dates as needed
+        ],
+        'zone_distribution': zone_distribution
+    }
+
+@cache.memoize(timeout=60)
+def overall_attendance_rate():
+    total_classes, total_present = db.session.query(
+        func.count(Attendance.id),
+        func.sum(case((Attendance.status == 'present', 1), else_=0))
+    ).one()
+    total_present = total_present or 0
+    return (total_present / total_classes) * 100 if total_classes > 0 else 0
+
 @faculty_ns.route('/student_analytics')
 class StudentAnalytics(Resource):
     @token_required
     def get(self, current_user):
         try:
             # Verify faculty role
-            faculty = User.query.filter_by(user_id=current_user, role='faculty').first()
+            faculty = db.session.query(User.department).filter_by(user_id=current_user, role='faculty').first()
             if not faculty:
                 return {'status': 'error', 'message': 'Unauthorized'}, 401
 
-            # Get all students in faculty's department
-            students = User.query.filter_by(
-                role='student', 
-                department=faculty.department
-            ).all()
-
-            analytics_data = []
-            for student in students:
-                # Calculate attendance stats
-                attendance_records = Attendance.query.filter_by(
-                    user_id=student.user_id
-                ).all()
-                
-                total_classes = len(attendance_records)
-                attended_classes = len([a for a in attendance_records if a.status == 'present'])
-                
-                attendance_percentage = (attended_classes / total_classes * 100) if total_classes > 0 else 0
-                
-                analytics_data.append({
-                    'user_id': student.user_id,
-                    'name': student.name,
-                    'total_classes': total_classes,
-                    'attended_classes': attended_classes,
-                    'attendance_percentage': round(attendance_percentage, 2)
-                })
-
-            return {
-                'status': 'success',
-                'data': {
-                    'students': analytics_data,
-                    'attendance_trend': [
-                        # Add sample attendance trend data
-                        {'date': '2024-03-01', 'attendance_rate': 85},
-                        {'date': '2024-03-02', 'attendance_rate': 90},
-                        # Add more dates as needed
-                    ],
-                    'zone_distribution': {
-                        'green': len([s for s in analytics_data if s['attendance_percentage'] >= 75]),
-                        'yellow': len([s for s in analytics_data if 60 <= s['attendance_percentage'] < 75]),
-                        'red': len([s for s in analytics_data if s['attendance_percentage'] < 60])
-                    }
-                }
-            }, 200
+            return json_response({'status': 'success', 'data': student_analytics(faculty.department)})
 
         except Exception as e:
             return {'status': 'error', 'message': str(e)}, 500
@@ -154,10 +222,7 @@ class OverallAnalytics(Resource):
     @token_required
     def get(self, current_user):
         try:
-            total_classes = Attendance.query.count()
-            total_present = Attendance.query.filter_by(status='present').count()
-            attendance_rate = (total_present / total_classes) * 100 if total_classes > 0 else 0
-            data = {'attendance': attendance_rate}
+            data = {'attendance': overall_attendance_rate()}
             return {'status': 'success', 'data': data}, 200
         except Exception as e:
             return jsonify({'status': 'error', 'message': 'Internal Server Error'}), 500
@@ -176,12 +241,16 @@ class UpdateAttendance(Resource):
             if new_status not in ['present', 'absent', 'late']:
                 return {'status': 'error', 'message': 'Invalid status'}, 400
             
-            attendance = Attendance.query.get(attendance_id)
-            if not attendance:
+            result = db.session.execute(
+                update(Attendance).where(Attendance.id == attendance_id).values(status=new_status)
+            )
+            if result.rowcount == 0:
+                db.session.rollback()
                 return {'status': 'error', 'message': 'Attendance record not found'}, 404
             
-            attendance.status = new_status
             db.session.commit()
+            cache.delete_memoized(student_analytics)
+            cache.delete_memoized(overall_attendance_rate)
             return {'status': 'success', 'message': 'Attendance updated successfully'}, 200
         except Exception as e:
             db.session.rollback()
@@ -193,11 +262,15 @@ class PendingRequests(Resource):
     def get(self, current_user):
         """Retrieves pending correction requests."""
         try:
-            faculty = User.query.filter_by(user_id=current_user, role='faculty').first()
-            if not faculty:
+            if not is_faculty(current_user):
                 return {'status': 'error', 'message': 'Access denied'}, 403
 
-            pending_requests = CorrectionRequest.query.filter_by(status='pending').all()
+            stmt = db.select(CorrectionRequest).options(
+                selectinload(CorrectionRequest.user),
+                selectinload(CorrectionRequest.attendance),
+                raiseload('*')
+            ).filter_by(status='pending')
+            pending_requests = db.session.scalars(stmt).all()
 
             requests_data = [{
                 'id': req.id,
@@ -221,16 +294,10 @@ class StudentsByAttendance(Resource):
             if percentage is None:
                 return {'status': 'error', 'message': 'Percentage parameter is required'}, 400
             
-            students = db.session.query(
-                User.user_id,
-                User.name,
-                db.func.count(Attendance.id).label('total_classes'),
-                func.sum(case((Attendance.status == 'present', 1), else_=0)).label('attended_classes')
-            ).join(Attendance, User.user_id == Attendance.user_id
-            ).filter(User.role == 'student'
-            ).group_by(User.user_id
-            ).having(func.sum(case((Attendance.status == 'present', 1), else_=0)) * 100 / db.func.count(Attendance.id) <= percentage
-            ).all()
+            stmt = attendance_summary_stmt + (lambda s: s.having(
+                func.sum(case((Attendance.status == 'present', 1), else_=0)) * 100 / func.count(Attendance.id) <= percentage
+            ))
+            students = db.session.execute(stmt).all()
 
             result = [{
                 'user_id': s.user_id,
@@ -238,7 +305,7 @@ class StudentsByAttendance(Resource):
                 'attendance_percentage': round((s.attended_classes / s.total_classes * 100), 2) if s.total_classes > 0 else 0
             } for s in students]
             
-            return {'status': 'success', 'data': result}, 200
+            return json_response({'status': 'success', 'data': result})
         except Exception as e:
             return {'status': 'error', 'message': str(e)}, 500
 
@@ -249,16 +316,11 @@ class DetainedStudents(Resource):
         """Retrieves a list of detained students based on attendance."""
         try:
             print("Executing detained students query")  # Debug print
-            detained_students = db.session.query(
-                User.user_id,
-                User.name,
-                db.func.count(Attendance.id).label('total_classes'),
-                func.sum(case((Attendance.status == 'present', 1), else_=0)).label('attended_classes')
-            ).join(Attendance, User.user_id == Attendance.user_id
-            ).filter(User.role == 'student'
-            ).group_by(User.user_id, User.name  # Include User.name in GROUP BY
-            ).having(func.sum(case((Attendance.status == 'present', 1), else_=0)) * 100 / db.func.count(Attendance.id) < 75
-            ).all()
+            threshold = 75
+            stmt = attendance_summary_stmt + (lambda s: s.having(
+                func.sum(case((Attendance.status == 'present', 1), else_=0)) * 100 / func.count(Attendance.id) < threshold
+            ))
+            detained_students = db.session.execute(stmt).all()
 
             print(f"Query result: {detained_students}")  # Debug print
 
@@ -270,11 +332,22 @@ class DetainedStudents(Resource):
             
             print(f"Formatted result: {result}")  # Debug print
 
-            return {'status': 'success', 'data': result}, 200
+            return json_response({'status': 'success', 'data': result})
         except Exception as e:
             print(f"Error occurred: {str(e)}")  # Debug print
             return {'status': 'error', 'message': str(e)}, 500
 
+def export_row(row):
+    total_classes = row['total_classes']
+    attended_classes = row['attended_classes']
+    return [
+        row['user_id'],
+        row['name'],
+        total_classes,
+        attended_classes,
+        round((attended_classes / total_classes * 100), 2) if total_classes > 0 else 0
+    ]
+
 @faculty_ns.route('/export_attendance')
 class ExportAttendance(Resource):
     @token_required
@@ -285,62 +358,72 @@ class ExportAttendance(Resource):
             start_date = request.args.get('start_date')
             end_date = request.args.get('end_date')
 
-            query = db.session.query(
-                User.user_id,
-                User.name,
-                func.count(Attendance.id).label('total_classes'),
-                func.sum(case((Attendance.status == 'present', 1), else_=0)).label('attended_classes')
-            ).join(Attendance, User.user_id == Attendance.user_id
-            ).filter(User.role == 'student')
-
+            stmt = attendance_summary_stmt
             if start_date:
-                query = query.filter(Attendance.check_in_time >= start_date)
+                stmt += lambda s: s.where(Attendance.check_in_time >= start_date)
             if end_date:
-                query = query.filter(Attendance.check_in_time <= end_date)
+                stmt += lambda s: s.where(Attendance.check_in_time <= end_date)
 
-            query = query.group_by(User.user_id)
-            results = query.all()
+            headers = ['User ID', 'Name', 'Total Classes', 'Attended Classes', 'Attendance Percentage']
 
-            data = [{
-                'User ID': result.user_id,
-                'Name': result.name,
-                'Total Classes': result.total_classes,
-                'Attended Classes': result.attended_classes,
-                'Attendance Percentage': round((result.attended_classes / result.total_classes * 100), 2) if result.total_classes > 0 else 0
-            } for result in results]
+            def fetch_rows():
+                return db.session.execute(
+                    stmt, execution_options={'stream_results': True}
+                ).mappings().yield_per(1000)
 
             if export_format == 'csv':
-                output = StringIO()
-                writer = csv.DictWriter(output, fieldnames=data[0].keys())
-                writer.writeheader()
-                writer.writerows(data)
-                output.seek(0)
-                return send_file(output, mimetype='text/csv', as_attachment=True, attachment_filename='attendance_report.csv')
-
-            elif export_format == 'pdf':
-                buffer = io.BytesIO()
-                doc = SimpleDocTemplate(buffer, pagesize=letter)
-                elements = []
-
-                table_data = [list(data[0].keys())] + [list(row.values()) for row in data]
-                t = Table(table_data)
-                t.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 14),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica')
-                ]))
-                elements.append(t)
-                doc.build(elements)
-
-                buffer.seek(0)
-                return send_file(buffer, mimetype='application/pdf', as_attachment=True, attachment_filename='attendance_report.pdf')
+                def generate():
+                    # Executed inside the generator: the server-side cursor must be opened
+                    # within the streamed response, after the view function has returned
+                    rows = fetch_rows()
+                    buffer = StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerow(headers)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                    for row in rows:
+                        writer.writerow(export_row(row))
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+
+                return Response(
+                    stream_with_context(generate()),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=attendance_report.csv'}
+                )
+
+            if export_format == 'pdf':
+                tmp = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+                tmp.close()
+                try:
+                    doc = SimpleDocTemplate(tmp.name, pagesize=letter)
+                    elements = []
+
+                    table_data = [headers] + [export_row(row) for row in fetch_rows()]
+                    t = LongTable(table_data, repeatRows=1, splitByRow=True)
+                    t.setStyle(TableStyle([
+                        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                        ('FONTSIZE', (0, 0), (-1, 0), 14),
+                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica')
+                    ]))
+                    elements.append(t)
+                    doc.build(elements)
+
+                    response = send_file(tmp.name, mimetype='application/pdf', as_attachment=True, download_name='attendance_report.pdf', conditional=True)
+                    response.call_on_close(lambda: os.remove(tmp.name))
+                    return response
+                except Exception:
+                    os.remove(tmp.name)
+                    raise
 
         except Exception as e:
             return {'status': 'error', 'message': str(e)}, 500
@@ -351,18 +434,18 @@ class FacultyNotifications(Resource):
     def get(self, current_user):
         """Retrieves unread notifications for the faculty."""
         try:
-            faculty = User.query.filter_by(user_id=current_user, role='faculty').first()
-            if not faculty:
+            if not is_faculty(current_user):
                 return {'status': 'error', 'message': 'Access denied'}, 403
 
-            notifications = Notification.query.filter_by(faculty_id=current_user, is_read=False).order_by(Notification.created_at.desc()).all()
+            notifications = db.session.query(
+                Notification.id,
+                Notification.student_id,
+                Notification.message,
+                func.to_char(Notification.created_at, 'YYYY-MM-DD"T"HH24:MI:SS').label('created_at')
+            ).filter_by(faculty_id=current_user, is_read=False
+            ).order_by(Notification.created_at.desc()).all()
 
-            notifications_data = [{
-                'id': notif.id,
-                'student_id': notif.student_id,
-                'message': notif.message,
-                'created_at': notif.created_at.isoformat()
-            } for notif in notifications]
+            notifications_data = [dict(notif._mapping) for notif in notifications]
 
             return {'status': 'success', 'notifications': notifications_data}, 200
 
@@ -374,8 +457,7 @@ class FacultyNotifications(Resource):
     def post(self, current_user):
         """Marks a notification as read."""
         try:
-            faculty = User.query.filter_by(user_id=current_user, role='faculty').first()
-            if not faculty:
+            if not is_faculty(current_user):
                 return {'status': 'error', 'message': 'Access denied'}, 403
 
             data = request.get_json()
@@ -384,11 +466,16 @@ class FacultyNotifications(Resource):
             if not notification_id:
                 return {'status': 'error', 'message': 'Notification ID is required'}, 400
 
-            notification = Notification.query.get(notification_id)
-            if not notification or notification.faculty_id != current_user:
+            result = db.session.execute(
+                update(Notification).where(
+                    Notification.id == notification_id,
+                    Notification.faculty_id == current_user
+                ).values(is_read=True)
+            )
+            if result.rowcount == 0:
+                db.session.rollback()
                 return {'status': 'error', 'message': 'Notification not found'}, 404
 
-            notification.is_read = True
             db.session.commit()
 
             return {'status': 'success', 'message': 'Notification marked as read'}, 200
@@ -403,7 +490,9 @@ class FacultyProfile(Resource):
     def get(self, current_user):
         """Retrieves the faculty's profile information."""
         try:
-            faculty = User.query.filter_by(user_id=current_user, role='faculty').first()
+            faculty = db.session.query(
+                User.user_id, User.name, User.email, User.department
+            ).filter_by(user_id=current_user, role='faculty').first()
             if not faculty:
                 return {'status': 'error', 'message': 'Faculty not found'}, 404
             
@@ -444,8 +533,17 @@ class ViewTimetable(Resource):
     @token_required
     def get(self, current_user):
         try:
-            timetable_entries = TimeTable.query.filter_by(user_id=current_user.user_id).all()
-            data = [entry.to_dict() for entry in timetable_entries]
+            rows = db.session.execute(select(
+                TimeTable.id,
+                TimeTable.user_id,
+                TimeTable.day,
+                TimeTable.period,
+                TimeTable.start_time,
+                TimeTable.end_time,
+                TimeTable.block_name,
+                TimeTable.wifi_name
+            ).where(TimeTable.user_id == current_user)).mappings().all()
+            data = [dict(row) for row in rows]
             return {'status': 'success', 'data': data}, 200
         except Exception as e:
             return jsonify({'status': 'error', 'message': 'Internal Server Error'}), 500
@@ -1,16 +1,39 @@
 from flask_restx import Namespace, Resource, fields
 from flask import request, jsonify, current_app
 from auth import token_required
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
-from datetime import datetime, timedelta, timezone
-from database import db, User, UserActivity
+import time
+from datetime import timedelta
+from sqlalchemy.exc import IntegrityError
+from database import db, User, UserActivity, utcnow, hash_password, verify_password, password_needs_rehash, is_unique_violation
+import re
 import secrets
-from zxcvbn import zxcvbn
+import os
+import base64
+import hashlib
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from create_app import limiter
+from flask_limiter.util import get_remote_address
 
 shared_ns = Namespace('shared', description='Shared operations')
 
+# zxcvbn scoring runs off the request thread with a hard upper bound. The budget sits
+# well above worst-case scoring time (~60 ms for a 72-character input), and a
+# timeout rejects the password so the check can't be bypassed by slow inputs.
+strength_executor = ThreadPoolExecutor(max_workers=2)
+STRENGTH_CHECK_TIMEOUT = 1.0
+ZXCVBN_MAX_LENGTH = 72
+
+TOKEN_LIFETIME = 24 * 60 * 60  # seconds
+
+# At least 8 characters with a lowercase letter, an uppercase letter and a digit
+PASSWORD_RULES = re.compile(r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d).{8,}$', re.DOTALL)
+
+# Verified against when the username doesn't exist so both paths cost one full hash
+DUMMY_PASSWORD_HASH = hash_password(secrets.token_urlsafe(16))
+
 # Define the user model for registration
 user_model = shared_ns.model('User', {
     'id': fields.String(required=True, description='User ID'),
@@ -41,8 +64,45 @@ reset_password_model = shared_ns.model('ResetPassword', {
     'new_password': fields.String(required=True, description='New password for the user')
 })
 
+class RandomPool:
+    """Hands out CSPRNG bytes from a buffer refilled with one os.urandom call per 4 KiB."""
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.buffer = b''
+        self.offset = 0
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def take(self, n):
+        with self.lock:
+            # Refill after a fork too, so pre-forked workers never share bytes
+            if self.pid != os.getpid() or self.offset + n > len(self.buffer):
+                self.buffer = os.urandom(max(self.size, n))
+                self.offset = 0
+                self.pid = os.getpid()
+            chunk = self.buffer[self.offset:self.offset + n]
+            self.offset += n
+            return chunk
+
+random_pool = RandomPool()
+
+def generate_reset_token():
+    return base64.urlsafe_b64encode(random_pool.take(32)).rstrip(b'=').decode()
+
+def hash_reset_token(token):
+    # Only the digest is stored, so a database dump holds no usable reset tokens
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def rate_limit_key(field):
+    # Key login/reset limits on the targeted account so rotating IPs doesn't reset the budget
+    data = request.get_json(silent=True) or {}
+    return str(data.get(field) or get_remote_address())
+
 @shared_ns.route('/register')
 class Register(Resource):
+    decorators = [limiter.limit("10 per hour")]
+
     @shared_ns.expect(user_model)
     @shared_ns.response(201, 'User registered successfully.')
     @shared_ns.response(400, 'Error in registration.')
@@ -51,12 +111,6 @@ class Register(Resource):
         try:
             data = request.get_json()
             user_id = data.get('id')
-
-            # Check if user_id already exists
-            if User.query.filter_by(user_id=user_id).first():
-                return {'status': 'error', 'message': 'User ID already exists.'}, 400
-
-            # Proceed with the rest of the registration logic
             name = data.get('name')
             role = data.get('role', '').lower()
             email = data.get('email')
@@ -81,10 +135,6 @@ class Register(Resource):
             if role == 'faculty' and not department:
                 return {'status': 'error', 'message': 'Department is required for faculty.'}, 400
             
-            if User.query.filter_by(email=email).first():
-                return {'status': 'error', 'message': 'Email already registered.'}, 400
-            hashed_password = generate_password_hash(password)
-
             new_user = User(
                 user_id=user_id,
                 name=name,
@@ -92,23 +142,36 @@ class Register(Resource):
                 email=email,
                 year=year,
                 branch=branch,
-                department=department,
-                password_hash=hashed_password
+                department=department
             )
+            new_user.set_password(password)
 
+            # Rely on the unique constraints instead of checking user_id and email up front
             db.session.add(new_user)
-            db.session.commit()
-
             log_user_activity(new_user.user_id, 'register')
+            try:
+                db.session.commit()
+            except IntegrityError as e:
+                db.session.rollback()
+                # NOT NULL and other constraint failures are real errors, not duplicates
+                if not is_unique_violation(e):
+                    raise
+                constraint = getattr(getattr(e.orig, 'diag', None), 'constraint_name', None) or str(e.orig)
+                if 'email' in constraint:
+                    return {'status': 'error', 'message': 'Email already registered.'}, 400
+                return {'status': 'error', 'message': 'User ID already exists.'}, 400
 
             return {'status': 'success', 'message': 'User registered successfully.'}, 201
 
         except Exception as e:
             db.session.rollback()
             current_app.logger.error(f"Error during registration: {str(e)}")
-            return {'status': 'error', 'message': 'An unexpected error occurred.'}, 500@shared_ns.route('/login')
-        
+            return {'status': 'error', 'message': 'An unexpected error occurred.'}, 500
+
+@shared_ns.route('/login')
 class Login(Resource):
+    decorators = [limiter.limit("5 per minute", key_func=lambda: rate_limit_key('username'))]
+
     @shared_ns.expect(login_model)
     @shared_ns.response(200, 'Login successful.')
     @shared_ns.response(401, 'Invalid username or password.')
@@ -122,23 +185,28 @@ class Login(Resource):
             if not username or not password:
                 return {'status': 'error', 'message': 'Missing username or password'}, 400
 
-            user = User.query.filter_by(user_id=username).first()
+            user = db.session.query(User.user_id, User.password_hash).filter_by(user_id=username).first()
+
+            password_ok = verify_password(user.password_hash if user else DUMMY_PASSWORD_HASH, password)
 
-            if user and check_password_hash(user.password_hash, password):
-                token = jwt.encode(
-                    {'user_id': user.user_id, 'exp': datetime.now(timezone.utc) + timedelta(hours=24)},
-                    current_app.config['SECRET_KEY'],
-                    algorithm="HS256"
-                )
+            if user and password_ok:
+                # Upgrade legacy PBKDF2 hashes to Argon2 while the plaintext is at hand
+                if password_needs_rehash(user.password_hash):
+                    User.query.filter_by(user_id=user.user_id).update({'password_hash': hash_password(password)})
                 log_user_activity(user.user_id, 'login')
+                db.session.commit()
+                token = issue_token(user.user_id)
                 return {'status': 'success', 'token': token}, 200
             
             return {'status': 'error', 'message': 'Invalid username or password'}, 401
         except Exception as e:
+            db.session.rollback()
             return {'status': 'error', 'message': str(e)}, 500
 
 @shared_ns.route('/forgot_password')
 class ForgotPassword(Resource):
+    decorators = [limiter.limit("5 per minute", key_func=lambda: rate_limit_key('user_id'))]
+
     @shared_ns.expect(forgot_password_model)  # Expecting the forgot password model
     @shared_ns.response(200, 'Password reset token generated successfully.')
     @shared_ns.response(404, 'User not found.')
@@ -156,10 +224,10 @@ class ForgotPassword(Resource):
             if not user:
                 return {'status': 'error', 'message': 'User not found.'}, 404
 
-            reset_token = secrets.token_urlsafe(32)
-            reset_token_expiry = datetime.utcnow() + timedelta(hours=1)
+            reset_token = generate_reset_token()
+            reset_token_expiry = utcnow() + timedelta(hours=1)
 
-            user.reset_token = reset_token
+            user.reset_token = hash_reset_token(reset_token)
             user.reset_token_expiry = reset_token_expiry
             db.session.commit()
 
@@ -175,6 +243,8 @@ class ForgotPassword(Resource):
 
 @shared_ns.route('/reset_password')
 class ResetPassword(Resource):
+    decorators = [limiter.limit("5 per minute", key_func=lambda: rate_limit_key('user_id'))]
+
     @shared_ns.expect(reset_password_model)  # Expecting the reset password model
     @shared_ns.response(200, 'Password reset successfully.')
     @shared_ns.response(400, 'All fields are required.')
@@ -189,12 +259,15 @@ class ResetPassword(Resource):
             if not all([user_id, reset_token, new_password]):
                 return {'status': 'error', 'message': 'All fields are required.'}, 400
 
-            user = User.query.filter_by(user_id=user_id, reset_token=reset_token).first()
+            user = User.query.filter_by(reset_token=hash_reset_token(reset_token)).first()
+
+            if not user or user.user_id != user_id or not user.reset_token_expiry:
+                return {'status': 'error', 'message': 'Invalid or expired reset token.'}, 400
 
-            if not user or user.reset_token_expiry < datetime.utcnow():
+            if user.reset_token_expiry < utcnow():
                 return {'status': 'error', 'message': 'Invalid or expired reset token.'}, 400
 
-            user.password_hash = generate_password_hash(new_password)
+            user.set_password(new_password)
             user.reset_token = None
             user.reset_token_expiry = None
             db.session.commit()
@@ -211,33 +284,47 @@ class RefreshToken(Resource):
     def post(self, current_user):
         """Refreshes the JWT token for the authenticated user."""
         try:
-            new_token = jwt.encode(
-                {'user_id': current_user, 'exp': datetime.now(timezone.utc) + timedelta(hours=24)},
-                current_app.config['SECRET_KEY'],
-                algorithm="HS256"
-            )
+            new_token = issue_token(current_user)
             return {'status': 'success', 'token': new_token}, 200
         except Exception as e:
             return {'status': 'error', 'message': str(e)}, 500
 
-def is_password_strong(password):
+@lru_cache(maxsize=4096)
+def zxcvbn_score(password):
+    from zxcvbn import zxcvbn  # Deferred: the frequency lists are large and only /register needs them
     result = zxcvbn(password)
-    if result['score'] < 3:
-        return False, result['feedback']['suggestions']
+    return result['score'], tuple(result['feedback']['suggestions'])
+
+def score_password(password):
+    # zxcvbn refuses inputs over 72 characters; score the first 72, which also
+    # keeps abnormally long inputs from filling the cache with distinct keys
+    return zxcvbn_score(password[:ZXCVBN_MAX_LENGTH])
+
+def issue_token(user_id):
+    # Integer epoch exp avoids building timezone-aware datetimes for every token
+    return jwt.encode(
+        {'user_id': user_id, 'exp': int(time.time()) + TOKEN_LIFETIME},
+        current_app.config['SECRET_KEY'],
+        algorithm="HS256"
+    )
+
+def is_password_strong(password):
+    # Load zxcvbn on this thread so its first import isn't counted against the timeout
+    import zxcvbn  # noqa: F401
+    future = strength_executor.submit(score_password, password)
+    try:
+        score, suggestions = future.result(timeout=STRENGTH_CHECK_TIMEOUT)
+    except FutureTimeoutError:
+        current_app.logger.warning("Password strength check timed out; rejecting password")
+        return False, ['Password strength could not be verified. Please try again.']
+    if score < 3:
+        return False, list(suggestions)
     return True, []
 
 def log_user_activity(user_id, activity_type, details=None):
+    # Only stages the row; the caller commits it together with its own changes
     new_activity = UserActivity(user_id=user_id, activity_type=activity_type, details=details)
     db.session.add(new_activity)
-    db.session.commit()
 
 def is_password_valid(password):
-    if len(password) < 8:
-        return False
-    if not any(char.isupper() for char in password):
-        return False
-    if not any(char.islower() for char in password):
-        return False
-    if not any(char.isdigit() for char in password):
-        return False
-    return True
\ No newline at end of file
+    return bool(PASSWORD_RULES.match(password))
\ No newline at end of file
@@ -1,13 +1,15 @@
 from flask_restx import Namespace, Resource, fields
 from flask import request, current_app
-from datetime import datetime, timedelta
-from database import db, Attendance, TimeTable, User, Notification, CorrectionRequest
+from datetime import date, datetime, timedelta
+from database import db, cache, attendance_daily_source, is_unique_violation, Attendance, TimeTable, User, Notification, CorrectionRequest
 from auth import token_required
 from flask_mail import Mail, Message
-import matplotlib.pyplot as plt
 import io
 import base64
-from sqlalchemy import case
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import case, func, insert, literal, select, true, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.exc import IntegrityError
 
 student_ns = Namespace('student', description='Student operations')
 
@@ -26,6 +28,35 @@ correction_request_model = student_ns.model('CorrectionRequest', {
     'reason': fields.String(required=True, description='Reason for correction request')
 })
 
+# SMTP delivery runs here so request handlers don't wait on the mail server
+mail_executor = ThreadPoolExecutor(max_workers=2)
+
+def send_mail(app, msg):
+    with app.app_context():
+        try:
+            Mail(app).send(msg)
+        except Exception as e:
+            app.logger.error(f"Failed to send email: {str(e)}")
+
+# Built once at import and reused by every timetable query that sorts by weekday
+DAY_ORDER = db.case(
+    {day: index for index, day in enumerate(
+        ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'], 1
+    )},
+    value=TimeTable.day
+)
+
+@cache.memoize(timeout=300)
+def late_notice_target(user_id):
+    """Returns the student's name and the user_id of a faculty member in their department."""
+    faculty = aliased(User)
+    row = db.session.query(
+        User.name,
+        faculty.user_id.label('faculty_id')
+    ).outerjoin(faculty, (faculty.department == User.department) & (faculty.role == 'faculty')
+    ).filter(User.user_id == user_id).first()
+    return (row.name, row.faculty_id) if row else None
+
 @student_ns.route('/mark_attendance')
 class MarkAttendance(Resource):
     @student_ns.expect(attendance_model)  # Expecting the attendance model
@@ -43,34 +74,47 @@ class MarkAttendance(Resource):
             now = datetime.now()
             day_of_week = now.strftime('%A').lower()
 
-            period_info = TimeTable.query.filter(
+            clock = now.strftime('%H:%M')
+            # Overlapping slots resolve to the earliest one, so period and lateness come from one row
+            tt = select(TimeTable.period, TimeTable.start_time).where(
                 TimeTable.user_id == current_user,
                 TimeTable.day == day_of_week,
-                TimeTable.start_time <= now.time(),
-                TimeTable.end_time >= now.time()
-            ).first()
-
-            period = period_info.period if period_info else "free_period"
-            is_late = now.time() > datetime.strptime(period_info.start_time, "%H:%M").time() if period_info else False
-
-            new_attendance = Attendance(
-                user_id=current_user,
-                check_in_time=now,
-                block_name=block_name,
-                period=period,
-                wifi_name=wifi_name,
-                status='present' if not is_llate else 'late'
-            )
-            db.session.add(new_attendance)
+                TimeTable.start_time <= clock,
+                TimeTable.end_time >= clock
+            ).order_by(TimeTable.start_time, TimeTable.id).limit(1).subquery('tt')
+            # Outer-joining to a one-row select still yields a row when no slot is current
+            anchor = select(literal(1).label('x')).subquery('x')
+
+            # Resolve the current period and late status inside the INSERT itself
+            stmt = insert(Attendance).from_select(
+                ['user_id', 'check_in_time', 'block_name', 'period', 'wifi_name', 'status'],
+                select(
+                    literal(current_user),
+                    literal(now),
+                    literal(block_name),
+                    func.coalesce(tt.c.period, 'free_period'),
+                    literal(wifi_name),
+                    case((tt.c.start_time < now.strftime('%H:%M:%S'), 'late'), else_='present')
+                ).select_from(anchor.outerjoin(tt, true()))
+            ).returning(Attendance.period, Attendance.status)
+            try:
+                period, status = db.session.execute(stmt).one()
+            except IntegrityError as e:
+                db.session.rollback()
+                # Only the open check-in index means a duplicate; FK and NOT NULL failures are real errors
+                if not is_unique_violation(e, 'ix_attendance_open'):
+                    raise
+                return {'status': 'error', 'message': 'You are already checked in. Check out before marking attendance again.'}, 409
+            is_late = status == 'late'
 
             if is_late:
-                student = User.query.filter_by(user_id=current_user).first()
-                faculty = User.query.filter_by(role='faculty', department=student.department).first()
-                if faculty:
+                target = late_notice_target(current_user)
+                if target and target[1]:
+                    student_name, faculty_id = target
                     notification = Notification(
-                        faculty_id=faculty.user_id,
+                        faculty_id=faculty_id,
                         student_id=current_user,
-                        message=f"Student {student.name} is late for {period} class."
+                        message=f"Student {student_name} is late for {period} class."
                     )
                     db.session.add(notification)
 
@@ -88,10 +132,10 @@ class Checkout(Resource):
     def post(self, current_user):
         """Checks out the student from the current attendance record."""
         try:
-            attendance_record = Attendance.query.filter_by(
+            attendance_record = db.session.query(Attendance.id, Attendance.check_in_time).filter_by(
                 user_id=current_user, 
                 check_out_time=None
-            ).order_by(Attendance.check_in_time.desc()).first()
+            ).first()
 
             if not attendance_record:
                 return {'status': 'error', 'message': 'No active attendance record found.'}, 404
@@ -99,10 +143,13 @@ class Checkout(Resource):
             check_out_time = datetime.now()
             duration = (check_out_time - attendance_record.check_in_time).total_seconds() // 60
 
-            attendance_record.check_out_time = check_out_time
-            attendance_record.duration = duration
-            attendance_record.status = 'present'
-
+            db.session.execute(
+                update(Attendance).where(Attendance.id == attendance_record.id).values(
+                    check_out_time=check_out_time,
+                    duration=duration,
+                    status='present'
+                )
+            )
             db.session.commit()
             return {'status': 'success', 'message': 'Checked out successfully.'}, 200
 
@@ -143,10 +190,7 @@ class ViewTimetable(Resource):
         """Views the student's timetable."""
         try:
             timetable = TimeTable.query.filter_by(user_id=current_user).order_by(
-                db.case(
-                    {'monday': 1, 'tuesday': 2, 'wednesday': 3, 'thursday': 4, 'friday': 5, 'saturday': 6, 'sunday': 7},
-                    value=TimeTable.day
-                ),
+                DAY_ORDER,
                 TimeTable.start_time
             ).all()
 
@@ -208,16 +252,22 @@ class NotifyUpcomingClasses(Resource):
         """Notifies the student of upcoming classes."""
         try:
             tomorrow = (datetime.now() + timedelta(days=1)).strftime('%A').lower()
-            classes = TimeTable.query.filter_by(user_id=current_user, day=tomorrow).order_by(TimeTable.start_time).all()
+            classes = db.session.query(
+                User.email,
+                TimeTable.period,
+                TimeTable.start_time,
+                TimeTable.block_name
+            ).join(TimeTable, TimeTable.user_id == User.user_id
+            ).filter(User.user_id == current_user, TimeTable.day == tomorrow
+            ).order_by(TimeTable.start_time).all()
             
             if classes:
-                user = User.query.filter_by(user_id=current_user).first()
-                msg = Message("Upcoming Classes", recipients=[user.email])  # Use email from User
+                msg = Message("Upcoming Classes", recipients=[classes[0].email])  # Every row carries the student's email
                 msg.body = f"You have {len(classes)} classes tomorrow:\n" + \
                            "\n".join([f"{c.period} at {c.start_time} in {c.block_name}" for c in classes])
-                Mail(current_app).send(msg)
+                mail_executor.submit(send_mail, current_app._get_current_object(), msg)
                 
-                return {"status": "success", "message": "Notification sent"}, 200
+                return {"status": "success", "message": "Notification queued"}, 202
             else:
                 return {'status': 'error', 'message': 'No classes found for tomorrow.'}, 404
         except Exception as e:
@@ -251,35 +301,56 @@ class RequestCorrection(Resource):
             db.session.rollback()
             return {'status': 'error', 'message': str(e)}, 500
 
+@cache.memoize(timeout=300)
+def weekly_attendance_chart(user_id, day):
+    """Weekly attendance rates and their PNG chart; `day` keys the cache to the current date."""
+    summary = attendance_daily_source()
+    if db.engine.dialect.name == 'postgresql':
+        week = func.to_char(summary.c.day, 'IW')
+    else:
+        week = func.strftime('%W', summary.c.day)
+    data = db.session.query(
+        week.label('week'),
+        func.sum(summary.c.total).label('total_classes'),
+        func.sum(summary.c.attended).label('attended_classes')
+    ).filter(summary.c.user_id == user_id
+    ).group_by('week'
+    ).order_by('week').all()
+    
+    weeks = [row.week for row in data]
+    # SUM over the view's bigint columns comes back as numeric/Decimal; JSON needs floats
+    attendance_rate = [float(row.attended_classes) / float(row.total_classes) * 100 for row in data]
+    
+    # Imported on first use to keep matplotlib out of workers that never draw a chart.
+    # A standalone Figure on the Agg canvas never touches pyplot, so nothing leaks between requests
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.plot(weeks, attendance_rate, marker='o')
+    ax.set_title('Weekly Attendance Rate')
+    ax.set_xlabel('Week')
+    ax.set_ylabel('Attendance Rate (%)')
+    ax.set_ylim(0, 100)
+    
+    img = io.BytesIO()
+    FigureCanvasAgg(fig).print_png(img)
+
+    return {
+        'labels': weeks,
+        'values': attendance_rate,
+        'chart': base64.b64encode(img.getvalue()).decode()
+    }
+
 @student_ns.route('/attendance_chart')
 class AttendanceChart(Resource):
     @token_required
     def get(self, current_user):
         """Generates an attendance chart for the student."""
         try:
-            data = db.session.query(
-                db.func.strftime('%W', Attendance.check_in_time).label('week'),
-                db.func.count().label('total_classes'),
-                db.func.sum(db.case([(Attendance.status == 'present', 1)], else_=0)).label('attended_classes')
-            ).filter(Attendance.user_id == current_user
-            ).group_by('week'
-            ).order_by('week').all()
-            
-            weeks = [row.week for row in data]
-            attendance_rate = [row.attended_classes / row.total_classes * 100 for row in data]
-            
-            plt.figure(figsize=(10, 5))
-            plt.plot(weeks, attendance_rate, marker='o')
-            plt.title('Weekly Attendance Rate')
-            plt.xlabel('Week')
-            plt.ylabel('Attendance Rate (%)')
-            plt.ylim(0, 100)
-            
-            img = io.BytesIO()
-            plt.savefig(img, format='png')
-            img.seek(0)
-            
-            return {"status": "success", "chart": base64.b64encode(img.getvalue()).decode()}, 200
+            chart = weekly_attendance_chart(current_user, date.today().isoformat())
+            return {"status": "success", **chart}, 200
         except Exception as e:
             return {'status': 'error', 'message': str(e)}, 500
 
@@ -289,7 +360,9 @@ class StudentProfile(Resource):
     def get(self, current_user):
         """Retrieves the student's profile information."""
         try:
-            student = User.query.filter_by(user_id=current_user, role='student').first()
+            student = db.session.query(
+                User.user_id, User.name, User.email, User.year, User.branch
+            ).filter_by(user_id=current_user, role='student').first()
             if not student:
                 return {'status': 'error', 'message': 'Student not found'}, 404
             
@@ -322,63 +395,69 @@ class StudentProfile(Resource):
             student.branch = data.get('branch', student.branch)
 
             db.session.commit()
+            cache.delete_memoized(late_notice_target, current_user)
             return {'status': 'success', 'message': 'Profile updated successfully.'}, 200
         except Exception as e:
             db.session.rollback()
             return {'status': 'error', 'message': str(e)}, 500
 
+@cache.memoize(timeout=300)
+def daily_attendance_analytics(user_id, day):
+    """Last 30 days of attendance rates and their PNG chart; `day` keys the cache to the current date."""
+    end_date = datetime.fromisoformat(day)
+    start_date = end_date - timedelta(days=30)
+    
+    summary = attendance_daily_source()
+    attendance_data = db.session.query(
+        summary.c.day,
+        summary.c.total,
+        summary.c.attended
+    ).filter(
+        summary.c.user_id == user_id,
+        summary.c.day.between(start_date.date(), end_date.date())
+    ).order_by(summary.c.day).all()
+    dates = [data.day.strftime('%Y-%m-%d') for data in attendance_data]
+    attendance_rates = [data.attended / data.total * 100 if data.total > 0 else 0 for data in attendance_data]
+
+    # Create a line chart
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    ax.plot(dates, attendance_rates, marker='o')
+    ax.set_title('Attendance Rate Over Last 30 Days')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Attendance Rate (%)')
+    ax.set_ylim(0, 100)
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+    # Convert plot to base64 encoded string
+    img = io.BytesIO()
+    FigureCanvasAgg(fig).print_png(img)
+    plot_url = base64.b64encode(img.getvalue()).decode()
+
+    # Calculate overall attendance rate
+    overall_attendance_rate = sum(attendance_rates) / len(attendance_rates) if attendance_rates else 0
+
+    return {
+        'overall_attendance_rate': round(overall_attendance_rate, 2),
+        'daily_attendance_rates': dict(zip(dates, attendance_rates)),
+        'labels': dates,
+        'values': attendance_rates,
+        'attendance_chart': plot_url
+    }
+
 @student_ns.route('/attendance_analytics')
 class AttendanceAnalytics(Resource):
     @token_required
     def get(self, current_user):
         """Retrieves attendance analytics for the last 30 days."""
         try:
-            # Get attendance data for the last 30 days
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-            
-            attendance_data = db.session.query(
-                db.func.date(Attendance.check_in_time).label('date'),
-                db.func.count(Attendance.id).label('total_classes'),
-                db.func.sum(
-                    case(
-                        (Attendance.status == 'present', 1),
-                        else_=0
-                    )
-                ).label('attended_classes')
-            ).filter(
-                Attendance.user_id == current_user,
-                Attendance.check_in_time.between(start_date, end_date)
-            ).group_by(db.func.date(Attendance.check_in_time)).all()
-            dates = [data.date.strftime('%Y-%m-%d') for data in attendance_data]
-            attendance_rates = [data.attended_classes / data.total_classes * 100 if data.total_classes > 0 else 0 for data in attendance_data]
-
-            # Create a line chart
-            plt.figure(figsize=(12, 6))
-            plt.plot(dates, attendance_rates, marker='o')
-            plt.title('Attendance Rate Over Last 30 Days')
-            plt.xlabel('Date')
-            plt.ylabel('Attendance Rate (%)')
-            plt.ylim(0, 100)
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-
-            # Convert plot to base64 encoded string
-            img = io.BytesIO()
-            plt.savefig(img, format='png')
-            img.seek(0)
-            plot_url = base64.b64encode(img.getvalue()).decode()
-
-            # Calculate overall attendance rate
-            overall_attendance_rate = sum(attendance_rates) / len(attendance_rates) if attendance_rates else 0
-
             return {
                 'status': 'success',
-                'data': {
-                    'overall_attendance_rate': round(overall_attendance_rate, 2),
-                    'daily_attendance_rates': dict(zip(dates, attendance_rates)),
-                    'attendance_chart': plot_url
-                }
+                'data': daily_attendance_analytics(current_user, date.today().isoformat())
             }, 200
 
         except Exception as e: